@@ -2,103 +2,150 @@
 Cloud Run MCP tools for Google Cloud Platform.
 """
 
-from google.cloud import run_v2
+import asyncio
+import functools
+import json
+import operator
+
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+
+from google.cloud import logging_v2
 from google.api_core.exceptions import NotFound
 from fastmcp import FastMCP
 
+from gcp_clients import borrow_run_client, get_logging_client
+
 cloud_run_mcp = FastMCP("gcp-cloud-run")
 
+# Number of services requested per page when listing, to keep round trips down for large projects
+LIST_PAGE_SIZE = 1000
+
+# Log entry fields returned by get_cloud_run_service_logs, and how to read each of them from a LogEntry.
+# Plain attributes use attrgetter, which is implemented in C and noticeably cheaper than a lambda per entry.
+# The payload is a string for text entries and a dict for structured entries.
+LOG_ENTRY_FIELDS = {
+    "timestamp": lambda entry: entry.timestamp and entry.timestamp.isoformat(),
+    "severity": operator.attrgetter("severity"),
+    "log_name": operator.attrgetter("log_name"),
+    "text_payload": lambda entry: entry.payload if isinstance(entry.payload, str) else None,
+    "json_payload": lambda entry: entry.payload if isinstance(entry.payload, dict) else None,
+    "labels": operator.attrgetter("labels"),
+}
+
+# Cloud Logging filter for the logs of a Cloud Run service, values must be quoted before formatting
+_LOG_FILTER_TEMPLATE = (
+    'resource.type="cloud_run_revision" '
+    'AND resource.labels.service_name={service_name} '
+    'AND resource.labels.location={region} '
+    'AND timestamp>={start}'
+)
+
+class ServiceInfo(NamedTuple):
+    """A Cloud Run service as listed by list_cloud_run_services"""
+    name: str
+    uri: str
+
 @cloud_run_mcp.tool()
 async def list_cloud_run_services(project_id: str, region: str) -> list[dict[str, str]]:
     """List all Cloud Run services in the specified project and region"""
-    services = await _list_cloud_run_services(project_id, region)
-    return services
+    try:
+        services = await _list_cloud_run_services(project_id, region)
+        return [service._asdict() for service in services]
+    except Exception as e:
+        return [{"error": f"Error listing Cloud Run services: {str(e)}"}]
 
 @cloud_run_mcp.tool()
 async def delete_cloud_run_service(service_name: str, project_id: str, region: str) -> dict[str, str]:
     """Delete a Cloud Run service from Google Cloud Run"""
-    result = await _delete_cloud_run_service(service_name, project_id, region)
-    return result
+    return await _delete_cloud_run_service(service_name, project_id, region)
 
 @cloud_run_mcp.tool()
-async def get_cloud_run_service_logs(service_name: str, project_id: str, region: str, limit: int = 100) -> list[dict]:
-    """Get the latest logs for a Cloud Run service (default 100 lines)"""
-    logs = await _get_cloud_run_service_logs(service_name, project_id, region, limit)
-    return logs
+async def get_cloud_run_service_logs(service_name: str, project_id: str, region: str, limit: int = 100, fields: list[str] | None = None, since_hours: int = 24) -> list[dict]:
+    """Get the latest logs for a Cloud Run service (default 100 lines from the last 24 hours), optionally only returning
+    the given fields (timestamp, severity, log_name, text_payload, json_payload, labels)"""
+    return await _get_cloud_run_service_logs(service_name, project_id, region, limit, fields, since_hours)
 
 
 #
 # Helper functions for Cloud Run services
 #
-async def _list_cloud_run_services(project_id: str, region: str) -> list[dict[str, str]]:
+@functools.lru_cache(maxsize=1024)
+def _project_path(project_id: str) -> str:
+    """Resource name of a project"""
+    return f"projects/{project_id}"
+
+@functools.lru_cache(maxsize=1024)
+def _parent_path(project_id: str, region: str) -> str:
+    """Resource name of the location holding the Cloud Run services of a project and region"""
+    return f"{_project_path(project_id)}/locations/{region}"
+
+@functools.lru_cache(maxsize=1024)
+def _service_path(project_id: str, region: str, service_name: str) -> str:
+    """Resource name of a Cloud Run service"""
+    return f"{_parent_path(project_id, region)}/services/{service_name}"
+
+async def _list_cloud_run_services(project_id: str, region: str) -> list[ServiceInfo]:
     """List all Cloud Run services in a project and region"""
-    try:
-        client = run_v2.ServicesClient()
-        parent = f"projects/{project_id}/locations/{region}"
-        
-        services = []
-        for service in client.list_services(parent=parent):
-            service_info = {
-                "name": service.name.split("/")[-1],
-                "uri": service.uri if hasattr(service, 'uri') else "N/A",
-            }
-            services.append(service_info)
-        
-        return services
-    except Exception as e:
-        return [{"error": f"Error listing Cloud Run services: {str(e)}"}]
+    parent = _parent_path(project_id, region)
+    request = {"parent": parent, "page_size": LIST_PAGE_SIZE}
+    # uri is a declared proto field, so it is always present (empty until the service is deployed)
+    with borrow_run_client() as client:
+        return [
+            ServiceInfo(service.name.rsplit("/", 1)[-1], service.uri or "N/A")
+            async for service in await client.list_services(request=request)
+        ]
 
 async def _delete_cloud_run_service(service_name: str, project_id: str, region: str) -> dict[str, str]:
     """Delete a Cloud Run service"""
     try:
-        client = run_v2.ServicesClient()
-        name = f"projects/{project_id}/locations/{region}/services/{service_name}"
+        name = _service_path(project_id, region, service_name)
         
-        # First check if the service exists
-        try:
-            client.get_service(name=name)
-        except NotFound:
-            return {"status": "error", "message": f"Service '{service_name}' not found in project '{project_id}' region '{region}'"}
-        
-        # If service exists, delete it
-        operation = client.delete_service(name=name)
-        # Wait for the operation to complete
-        operation.result()
+        with borrow_run_client() as client:
+            # Delete straight away, the API reports a missing service with NotFound
+            try:
+                operation = await client.delete_service(name=name)
+            except NotFound:
+                return {"status": "error", "message": f"Service '{service_name}' not found in project '{project_id}' region '{region}'"}
+            # Wait for the operation to complete
+            await operation.result()
         return {"status": "success", "message": f"Service '{service_name}' successfully deleted"}
     except Exception as e:
         return {"status": "error", "message": f"Error deleting service: {str(e)}"}
 
-async def _get_cloud_run_service_logs(service_name: str, project_id: str, region: str, limit: int = 100) -> list[dict]:
+def _collect_log_entries(client: logging_v2.Client, project_id: str, filter_str: str, limit: int, getters: list) -> list[dict]:
+    """Fetch the latest log entries of a project matching a filter and convert them to dicts"""
+    # max_results stops the iterator after `limit` entries instead of fetching further pages
+    entries = client.list_entries(
+        resource_names=[_project_path(project_id)],
+        filter_=filter_str,
+        order_by=logging_v2.DESCENDING,
+        max_results=limit,
+        page_size=limit
+    )
+    return [{field: getter(entry) for field, getter in getters} for entry in entries]
+
+async def _get_cloud_run_service_logs(service_name: str, project_id: str, region: str, limit: int = 100, fields: list[str] | None = None, since_hours: int = 24) -> list[dict]:
     """Fetch the latest logs for a Cloud Run service using Cloud Logging API"""
-    from google.cloud import logging_v2
-    import datetime
-    client = logging_v2.Client(project=project_id)
-    # Filter for logs from the specific Cloud Run service
-    filter_str = (
-        f'resource.type="cloud_run_revision" '
-        f'AND resource.labels.service_name="{service_name}" '
-        f'AND resource.labels.location="{region}"'
+    unknown_fields = set(fields or ()) - LOG_ENTRY_FIELDS.keys()
+    if unknown_fields:
+        return [{"error": f"Unknown log entry fields: {', '.join(sorted(unknown_fields))}"}]
+    getters = [(field, LOG_ENTRY_FIELDS[field]) for field in fields or LOG_ENTRY_FIELDS]
+
+    client = get_logging_client(project_id)
+    # Quote the values so that they cannot change the meaning of the filter. The lower bound on the
+    # timestamp lets Cloud Logging skip older log partitions instead of scanning the whole retention period.
+    start = datetime.now(timezone.utc) - timedelta(hours=since_hours)
+    filter_str = _LOG_FILTER_TEMPLATE.format(
+        service_name=json.dumps(service_name),
+        region=json.dumps(region),
+        start=json.dumps(start.isoformat()),
     )
     try:
-        entries = client.list_entries(
-            filter_=filter_str,
-            order_by=logging_v2.DESCENDING,
-            page_size=limit
-        )
-        logs = []
-        for entry in entries:
-            logs.append({
-                "timestamp": entry.timestamp.isoformat() if entry.timestamp else None,
-                "severity": entry.severity,
-                "log_name": entry.log_name,
-                "text_payload": getattr(entry, 'text_payload', None),
-                "json_payload": getattr(entry, 'json_payload', None),
-                "labels": getattr(entry, 'labels', None),
-            })
-        return logs
+        # The logging client is blocking and fetches pages while it is iterated, so run it off the event loop
+        return await asyncio.to_thread(_collect_log_entries, client, project_id, filter_str, limit, getters)
     except Exception as e:
         return [{"error": f"Error fetching logs: {str(e)}"}]
 
-
 if __name__ == "__main__":
     cloud_run_mcp.run(transport='stdio') 
\ No newline at end of file
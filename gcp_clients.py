@@ -0,0 +1,93 @@
+"""
+Shared Google Cloud Platform clients for the MCP tools.
+
+Clients are expensive to construct (credential discovery, channel setup), so they are created
+once per process and reused by every server and tool invocation.
+"""
+
+import contextlib
+import functools
+import os
+from collections.abc import Iterator
+
+import google.auth
+from google.auth.credentials import Credentials
+from google.cloud import logging_v2, run_v2, secretmanager
+from google.cloud.run_v2.services.services.transports import ServicesGrpcAsyncIOTransport
+from google.cloud.secretmanager_v1.services.secret_manager_service.transports import SecretManagerServiceGrpcAsyncIOTransport
+
+# gRPC channel tuning: keepalive pings detect dead connections while calls are in flight (pings are
+# not sent on idle channels) and larger HTTP/2 flow control windows keep big list responses from
+# being throttled
+GRPC_CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.http2.max_pings_without_data", 0),
+    ("grpc.http2.initial_connection_window_size", 8 * 1024 * 1024),
+    ("grpc.http2.initial_window_size", 8 * 1024 * 1024),
+]
+
+# Maximum number of Cloud Run clients, each with its own gRPC channel, that concurrent calls are spread over
+RUN_CHANNEL_POOL_SIZE = int(os.environ.get("GCP_MCP_RUN_CHANNEL_POOL_SIZE", "8"))
+
+# Number of projects whose Cloud Logging client is kept, project IDs come from tool input so the
+# least recently used clients are dropped beyond this
+LOGGING_CLIENT_CACHE_SIZE = 16
+
+# The accessors below never await, so they cannot interleave on the event loop and need no lock
+_secret_client: secretmanager.SecretManagerServiceAsyncClient | None = None
+_run_clients: list[run_v2.ServicesAsyncClient] = []
+# Number of calls in flight on each client of _run_clients
+_run_client_calls: list[int] = []
+
+
+def _create_secret_channel(*args, options=(), **kwargs):
+    """Create a gRPC channel for the Secret Manager API using the tuned channel options"""
+    options = [*options, *GRPC_CHANNEL_OPTIONS]
+    return SecretManagerServiceGrpcAsyncIOTransport.create_channel(*args, options=options, **kwargs)
+
+def _create_run_channel(*args, options=(), **kwargs):
+    """Create a gRPC channel for the Cloud Run API with a connection of its own"""
+    # gRPC shares connections between channels created with identical arguments,
+    # which would collapse the whole pool onto a single HTTP/2 connection
+    options = [*options, *GRPC_CHANNEL_OPTIONS, ("grpc.use_local_subchannel_pool", 1)]
+    return ServicesGrpcAsyncIOTransport.create_channel(*args, options=options, **kwargs)
+
+def get_secret_client() -> secretmanager.SecretManagerServiceAsyncClient:
+    """Return the process-wide Secret Manager client, creating it on first use"""
+    global _secret_client
+    if _secret_client is None:
+        transport = functools.partial(SecretManagerServiceGrpcAsyncIOTransport, channel=_create_secret_channel)
+        _secret_client = secretmanager.SecretManagerServiceAsyncClient(transport=transport)
+    return _secret_client
+
+@functools.cache
+def _run_credentials() -> Credentials:
+    """Application default credentials for the Cloud Run clients, discovered once and shared by the pool"""
+    credentials, _ = google.auth.default(scopes=ServicesGrpcAsyncIOTransport.AUTH_SCOPES)
+    return credentials
+
+@contextlib.contextmanager
+def borrow_run_client() -> Iterator[run_v2.ServicesAsyncClient]:
+    """
+    Borrow a Cloud Run services client from the process-wide pool for the duration of a call.
+
+    The least busy client is handed out. A new client is only added to the pool when every existing
+    one has calls in flight, up to RUN_CHANNEL_POOL_SIZE clients.
+    """
+    index = min(range(len(_run_clients)), key=_run_client_calls.__getitem__, default=None)
+    if index is None or (_run_client_calls[index] and len(_run_clients) < RUN_CHANNEL_POOL_SIZE):
+        transport = functools.partial(ServicesGrpcAsyncIOTransport, channel=_create_run_channel)
+        _run_clients.append(run_v2.ServicesAsyncClient(credentials=_run_credentials(), transport=transport))
+        _run_client_calls.append(0)
+        index = len(_run_clients) - 1
+    _run_client_calls[index] += 1
+    try:
+        yield _run_clients[index]
+    finally:
+        _run_client_calls[index] -= 1
+
+@functools.lru_cache(maxsize=LOGGING_CLIENT_CACHE_SIZE)
+def get_logging_client(project_id: str) -> logging_v2.Client:
+    """Return the process-wide Cloud Logging client for a project, creating it on first use"""
+    return logging_v2.Client(project=project_id)
@@ -16,6 +16,10 @@ async def create_composed_server():
     
     return main_server
 
-if __name__ == "__main__":
+def main():
+    """Run the composed server with all GCP tools over stdio"""
     main_server = asyncio.run(create_composed_server())
-    main_server.run(transport='stdio')
\ No newline at end of file
+    main_server.run(transport='stdio')
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
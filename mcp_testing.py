@@ -0,0 +1,86 @@
+"""
+Helpers for testing MCP tools through an in-process FastMCP client.
+"""
+
+import asyncio
+import inspect
+import unittest
+
+from fastmcp import Client, FastMCP
+
+
+async def async_iter(items):
+    """Stand in for the async pagers returned by list calls"""
+    for item in items:
+        yield item
+
+def async_return(value):
+    """Side effect making a MagicMock stand in for a coroutine function returning `value`"""
+    async def coroutine(*args, **kwargs):
+        return value
+    return coroutine
+
+def async_raise(error: Exception):
+    """Side effect making a MagicMock stand in for a coroutine function raising `error`"""
+    async def coroutine(*args, **kwargs):
+        raise error
+    return coroutine
+
+
+class SharedLoopTestCase(unittest.TestCase):
+    """
+    Test case running all its tests on one event loop per class instead of a new loop per test.
+
+    Tests run their coroutines on the event loop of the class with _run.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls._loop = asyncio.new_event_loop()
+        cls.addClassCleanup(cls._loop.close)
+        cls.addClassCleanup(lambda: cls._loop.run_until_complete(cls._loop.shutdown_default_executor()))
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # unittest would call a coroutine test method without awaiting it, so its body would never run
+        for name, attribute in vars(cls).items():
+            if name.startswith("test") and inspect.iscoroutinefunction(attribute):
+                raise TypeError(f"{cls.__name__}.{name} is a coroutine, run its awaits with self._run instead")
+
+    def _run(self, coro):
+        return self._loop.run_until_complete(coro)
+
+
+class MCPToolTestCase(SharedLoopTestCase):
+    """Test case calling the tools of `mcp` through one client session shared by every test of the class"""
+
+    mcp: FastMCP
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.client = cls._loop.run_until_complete(cls._open_client())
+
+    @classmethod
+    async def _open_client(cls) -> Client:
+        """Open the client session of the class, closed again once all its tests ran"""
+        # A session has to be entered and exited by the same task, so it is held open by a task of its own
+        opened = asyncio.get_running_loop().create_future()
+        closing = asyncio.Event()
+
+        async def hold_session():
+            async with Client(cls.mcp) as client:
+                opened.set_result(client)
+                await closing.wait()
+
+        session = asyncio.create_task(hold_session())
+        await asyncio.wait([opened, session], return_when=asyncio.FIRST_COMPLETED)
+        if not opened.done():
+            # The session could not be opened, surface the error
+            session.result()
+
+        async def close_session():
+            closing.set()
+            await session
+        cls.addClassCleanup(lambda: cls._loop.run_until_complete(close_session()))
+        return opened.result()
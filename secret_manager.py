@@ -2,12 +2,33 @@
 Secret Manager MCP tools for Google Cloud Platform.
 """
 
-from google.cloud import secretmanager
+import asyncio
+import functools
+import os
+import time
+
 from google.api_core.exceptions import NotFound
 from fastmcp import FastMCP
 
+from gcp_clients import get_secret_client
+
 secret_manager_mcp = FastMCP("gcp-secret-manager")
 
+# Maximum number of secrets read concurrently by a single get_secret_values call
+MAX_CONCURRENT_SECRET_READS = 32
+
+# Number of secrets requested per page when listing, to keep round trips down for large projects
+LIST_PAGE_SIZE = 1000
+
+# How long (in seconds) a secret value is served from memory before it is read again
+SECRET_TTL_SECONDS = int(os.environ.get("GCP_MCP_SECRET_TTL", "300"))
+# Maximum number of secret values kept in memory, the oldest reads are dropped beyond this
+SECRET_CACHE_SIZE = 256
+# (project_id, secret_name) -> (time the value was read, secret value), oldest read first
+_secret_cache: dict[tuple[str, str], tuple[float, str]] = {}
+# (project_id, secret_name) -> read of the secret currently in flight, shared by concurrent cache misses
+_secret_inflight: dict[tuple[str, str], asyncio.Task] = {}
+
 @secret_manager_mcp.tool()
 async def list_secrets(project_id: str, prefix: str = "") -> list[str]:
     """List all secrets in the project"""
@@ -34,57 +55,112 @@ async def get_secret_value(secret_name: str, project_id: str) -> dict[str, str]:
     except Exception as e:
         return {"status": "error", "message": f"Error retrieving secret: {str(e)}"}
 
+@secret_manager_mcp.tool()
+async def get_secret_values(secret_names: list[str], project_id: str) -> dict[str, dict[str, str]]:
+    """Get several secret values from Google Cloud Secret Manager at once"""
+    results = await _get_secrets(secret_names, project_id)
+    return {
+        secret_name: {"status": "error", "message": f"Error retrieving secret: {str(result)}"}
+        if isinstance(result, Exception)
+        else {"status": "success", "value": result}
+        for secret_name, result in zip(secret_names, results)
+    }
+
 
 #
 # Helper functions for secret management
 #
 async def _get_secret(secret_name: str, project_id: str) -> str:
-    """Get a secret from Google Cloud Secret Manager"""
-    client = secretmanager.SecretManagerServiceClient()
+    """Get a secret from Google Cloud Secret Manager, served from the cache while fresh"""
+    key = (project_id, secret_name)
+    cached = _secret_cache.get(key)
+    if cached is not None:
+        if time.monotonic() - cached[0] < SECRET_TTL_SECONDS:
+            return cached[1]
+        # Drop the stale value right away, so it does not outlive a failed refresh
+        del _secret_cache[key]
+
+    task = _secret_inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_access_secret(secret_name, project_id))
+        task.add_done_callback(functools.partial(_store_secret, key))
+        _secret_inflight[key] = task
+    # Shielded so that a cancelled caller does not cancel the read for everyone else waiting on it
+    return await asyncio.shield(task)
+
+async def _access_secret(secret_name: str, project_id: str) -> str:
+    """Read the latest version of a secret from Google Cloud Secret Manager"""
+    client = get_secret_client()
     name = f"projects/{project_id}/secrets/{secret_name}/versions/latest"
-    response = client.access_secret_version(name=name)
+    response = await client.access_secret_version(name=name)
     return response.payload.data.decode("UTF-8")
+
+def _store_secret(key: tuple[str, str], task: asyncio.Task) -> None:
+    """Cache the value of a finished secret read, unless the secret was changed while it was being read"""
+    if _secret_inflight.get(key) is not task:
+        return
+    del _secret_inflight[key]
+    if SECRET_TTL_SECONDS <= 0 or task.cancelled() or task.exception() is not None:
+        return
+    # Re-insert so the cache stays ordered by read time
+    _secret_cache.pop(key, None)
+    _secret_cache[key] = (time.monotonic(), task.result())
+    if len(_secret_cache) > SECRET_CACHE_SIZE:
+        del _secret_cache[next(iter(_secret_cache))]
+
+def _invalidate_secret(secret_name: str, project_id: str) -> None:
+    """Forget the cached value of a secret and any read of it in flight"""
+    _secret_cache.pop((project_id, secret_name), None)
+    _secret_inflight.pop((project_id, secret_name), None)
+
+async def _get_secrets(secret_names: list[str], project_id: str) -> list[str | Exception]:
+    """Get several secrets concurrently, returning either the value or the error for each of them"""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_SECRET_READS)
+
+    async def get_secret(secret_name: str) -> str:
+        async with semaphore:
+            return await _get_secret(secret_name, project_id)
+
+    return await asyncio.gather(*(get_secret(name) for name in secret_names), return_exceptions=True)
     
 async def _list_secrets(project_id: str, prefix: str = "") -> list[str]:
     """List all secrets in the project"""
-    client = secretmanager.SecretManagerServiceClient()
-    parent = client.project_path(project_id)
+    client = get_secret_client()
+    parent = client.common_project_path(project_id)
     filter_str = f"name:{prefix}*" if prefix else ""
-    return [secret.name for secret in client.list_secrets(parent=parent, filter=filter_str)]
+    request = {"parent": parent, "filter": filter_str, "page_size": LIST_PAGE_SIZE}
+    return [secret.name async for secret in await client.list_secrets(request=request)]
     
 async def _delete_secret(secret_name: str, project_id: str) -> None:
     """Delete a secret from Google Cloud Secret Manager"""
-    client = secretmanager.SecretManagerServiceClient()
+    client = get_secret_client()
     name = f"projects/{project_id}/secrets/{secret_name}"
-    client.delete_secret(name=name)
+    await client.delete_secret(name=name)
+    _invalidate_secret(secret_name, project_id)
     
 async def _add_secret(secret_name: str, project_id: str, secret_value: str) -> str:
     """Adds a new secret or a new version to an existing secret."""
-    client = secretmanager.SecretManagerServiceClient()
+    client = get_secret_client()
     project_path = f"projects/{project_id}"
     secret_path = f"{project_path}/secrets/{secret_name}"
+    payload = {"data": secret_value.encode("UTF-8")}
 
     try:
-        # Check if secret exists
-        client.get_secret(name=secret_path)
-        # If secret exists, add a new version
-        payload = secret_value.encode("UTF-8")
-        version = client.add_secret_version(
-            parent=secret_path, payload={"data": payload}
-        )
+        # Most calls target an existing secret, so add the version straight away
+        version = await client.add_secret_version(parent=secret_path, payload=payload)
         return version.name
     except NotFound:
         # If secret does not exist, create it and add a version
-        secret = client.create_secret(
+        secret = await client.create_secret(
             parent=project_path,
             secret_id=secret_name,
             secret={"replication": {"automatic": {}}},
         )
-        payload = secret_value.encode("UTF-8")
-        version = client.add_secret_version(
-            parent=secret.name, payload={"data": payload}
-        )
+        version = await client.add_secret_version(parent=secret.name, payload=payload)
         return version.name
+    finally:
+        # The latest version has changed, so a cached value is stale
+        _invalidate_secret(secret_name, project_id)
 
 
 if __name__ == "__main__":
@@ -1,151 +1,249 @@
+import json
 import unittest
-from unittest.mock import patch, MagicMock, AsyncMock
-import asyncio
+from unittest.mock import patch, call, MagicMock, create_autospec
+import pytest
+import threading
+from types import SimpleNamespace
+from datetime import datetime, timezone
 from google.api_core.exceptions import NotFound
+from google.cloud import logging_v2, run_v2
+
+from mcp_testing import MCPToolTestCase, SharedLoopTestCase, async_iter, async_raise, async_return
 
 # Import the functions to test
 import cloud_run
-from cloud_run import _list_cloud_run_services, _delete_cloud_run_service, _get_cloud_run_service_logs, cloud_run_mcp
+import gcp_clients
+from cloud_run import _list_cloud_run_services, _delete_cloud_run_service, _get_cloud_run_service_logs, cloud_run_mcp, ServiceInfo
+
+
+class _Operation:
+    """Stand in for the long-running operation returned by delete_service"""
+
+    def __init__(self):
+        self.result_calls = 0
+
+    async def result(self):
+        self.result_calls += 1
 
 
-class TestCloudRunHelperFunctions(unittest.TestCase):
+# Client class mocks shared by the tests of this module, as building a spec'd mock walks the whole class
+_RUN_CLIENT_CLASS = create_autospec(run_v2.ServicesAsyncClient)
+_LOGGING_CLIENT_CLASS = MagicMock(name="LoggingClient")
+
+
+class TestCloudRunHelperFunctions(SharedLoopTestCase):
     """Test cases for Cloud Run helper functions"""
 
-    @patch('cloud_run.run_v2.ServicesClient')
-    def test_list_cloud_run_services_valid_region(self, mock_services_client):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Patch the client classes and credential discovery once for the whole class, the client classes
+        # are reset before each test
+        for target, mock in [('gcp_clients.run_v2.ServicesAsyncClient', _RUN_CLIENT_CLASS),
+                             ('gcp_clients.logging_v2.Client', _LOGGING_CLIENT_CLASS),
+                             ('gcp_clients.google.auth.default', MagicMock(return_value=(MagicMock(), "test-project")))]:
+            patcher = patch(target, mock)
+            patcher.start()
+            cls.addClassCleanup(patcher.stop)
+
+    def setUp(self):
+        for client_class in (_RUN_CLIENT_CLASS, _LOGGING_CLIENT_CLASS):
+            client_class.reset_mock()
+            client_class.return_value.reset_mock(return_value=True, side_effect=True)
+        self.mock_run_client = _RUN_CLIENT_CLASS.return_value
+        self.mock_logging_client = _LOGGING_CLIENT_CLASS.return_value
+        # Drop cached clients so each test constructs them from the patched client classes
+        gcp_clients._run_clients.clear()
+        gcp_clients._run_client_calls.clear()
+        gcp_clients._run_credentials.cache_clear()
+        gcp_clients.get_logging_client.cache_clear()
+
+    def test_list_cloud_run_services_valid_region(self):
         """Test listing Cloud Run services with a valid region"""
-        mock_client = mock_services_client.return_value
-        mock_service = MagicMock()
-        mock_service.name = "projects/test-project/locations/us-central1/services/test-service"
-        mock_service.uri = "https://test-service-xyz.run.app"
-        mock_client.list_services.return_value = [mock_service]
+        mock_client = self.mock_run_client
+        mock_service = SimpleNamespace(
+            name="projects/test-project/locations/us-central1/services/test-service",
+            uri="https://test-service-xyz.run.app",
+        )
+        mock_client.list_services.return_value = async_iter([mock_service])
         
-        result = asyncio.run(_list_cloud_run_services("test-project", "us-central1"))
+        result = self._run(_list_cloud_run_services("test-project", "us-central1"))
         
-        mock_client.list_services.assert_called_once_with(parent="projects/test-project/locations/us-central1")
-        self.assertEqual(len(result), 1)
-        self.assertEqual(result[0]["name"], "test-service")
-        self.assertEqual(result[0]["uri"], "https://test-service-xyz.run.app")
+        self.assertEqual(mock_client.mock_calls, [
+            call.list_services(request={"parent": "projects/test-project/locations/us-central1", "page_size": cloud_run.LIST_PAGE_SIZE}),
+        ])
+        self.assertEqual(result, [ServiceInfo("test-service", "https://test-service-xyz.run.app")])
+
+    def test_list_cloud_run_services_without_uri(self):
+        """Test listing a Cloud Run service that has no URI yet"""
+        mock_client = self.mock_run_client
+        service = run_v2.Service(name="projects/test-project/locations/us-central1/services/test-service")
+        mock_client.list_services.return_value = async_iter([service])
 
-    @patch('cloud_run.run_v2.ServicesClient')
-    def test_delete_cloud_run_service(self, mock_client_class):
+        result = self._run(_list_cloud_run_services("test-project", "us-central1"))
+
+        self.assertEqual(result, [ServiceInfo("test-service", "N/A")])
+
+    def test_delete_cloud_run_service(self):
         """Test deleting a Cloud Run service"""
-        mock_client = mock_client_class.return_value
-        mock_operation = MagicMock()
-        mock_client.delete_service.return_value = mock_operation
+        mock_client = self.mock_run_client
+        operation = _Operation()
+        mock_client.delete_service.return_value = operation
         
-        result = asyncio.run(_delete_cloud_run_service("test-service", "test-project", "us-central1"))
+        result = self._run(_delete_cloud_run_service("test-service", "test-project", "us-central1"))
         
-        mock_client.delete_service.assert_called_once_with(
-            name="projects/test-project/locations/us-central1/services/test-service"
-        )
-        mock_operation.result.assert_called_once()
+        self.assertEqual(mock_client.mock_calls, [
+            call.delete_service(name="projects/test-project/locations/us-central1/services/test-service"),
+        ])
+        self.assertEqual(operation.result_calls, 1)
         self.assertEqual(result["status"], "success")
 
-    @patch('cloud_run.run_v2.ServicesClient')
-    def test_delete_cloud_run_service_not_found(self, mock_client_class):
+    def test_delete_cloud_run_service_not_found(self):
         """Test deleting a nonexistent Cloud Run service"""
-        mock_client = mock_client_class.return_value
-        mock_client.get_service.side_effect = NotFound("Service not found")
+        mock_client = self.mock_run_client
+        mock_client.delete_service.side_effect = NotFound("Service not found")
         
-        result = asyncio.run(_delete_cloud_run_service("nonexistent-service", "test-project", "us-central1"))
+        result = self._run(_delete_cloud_run_service("nonexistent-service", "test-project", "us-central1"))
         
-        mock_client.get_service.assert_called_once_with(
-            name="projects/test-project/locations/us-central1/services/nonexistent-service"
-        )
+        self.assertEqual(mock_client.mock_calls, [
+            call.delete_service(name="projects/test-project/locations/us-central1/services/nonexistent-service"),
+        ])
         self.assertEqual(result["status"], "error")
         self.assertIn("not found", result["message"])
 
-    @patch('google.cloud.logging_v2.Client')
-    def test_get_cloud_run_service_logs(self, mock_logging_client):
+    def test_get_cloud_run_service_logs(self):
         """Test fetching logs for a Cloud Run service"""
-        mock_client = mock_logging_client.return_value
-        mock_entry = MagicMock()
-        mock_entry.timestamp = None
-        mock_entry.severity = "INFO"
-        mock_entry.log_name = "projects/test-project/logs/run.googleapis.com%2Fstdout"
-        mock_entry.text_payload = "Test log entry"
-        mock_entry.json_payload = None
-        mock_entry.labels = {"test": "label"}
-        mock_client.list_entries.return_value = [mock_entry]
-
-        result = asyncio.run(_get_cloud_run_service_logs("test-service", "test-project", "us-central1", 10))
+        mock_client = self.mock_logging_client
+        entry = logging_v2.TextEntry(
+            log_name="projects/test-project/logs/run.googleapis.com%2Fstdout",
+            severity="INFO",
+            payload="Test log entry",
+            labels={"test": "label"},
+        )
+        mock_client.list_entries.return_value = [entry]
+
+        result = self._run(_get_cloud_run_service_logs("test-service", "test-project", "us-central1", 10))
         mock_client.list_entries.assert_called_once()
+        self.assertEqual(mock_client.list_entries.call_args.kwargs["max_results"], 10)
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0]["text_payload"], "Test log entry")
+        self.assertIsNone(result[0]["json_payload"])
         self.assertEqual(result[0]["severity"], "INFO")
         self.assertIsNone(result[0]["timestamp"])
 
-    @patch('google.cloud.logging_v2.Client')
-    def test_get_cloud_run_service_logs_error(self, mock_logging_client):
+    def test_get_cloud_run_service_logs_fields(self):
+        """Test fetching only some fields of the logs for a Cloud Run service"""
+        mock_client = self.mock_logging_client
+        entry = logging_v2.StructEntry(severity="ERROR", payload={"message": "Test log entry"})
+        mock_client.list_entries.return_value = [entry]
+
+        result = self._run(_get_cloud_run_service_logs("test-service", "test-project", "us-central1", 10, ["severity", "json_payload"]))
+
+        self.assertEqual(result, [{"severity": "ERROR", "json_payload": {"message": "Test log entry"}}])
+
+    def test_get_cloud_run_service_logs_unknown_field(self):
+        """Test requesting a log entry field that does not exist"""
+        result = self._run(_get_cloud_run_service_logs("test-service", "test-project", "us-central1", 10, ["payload"]))
+
+        self.mock_logging_client.list_entries.assert_not_called()
+        self.assertEqual(result, [{"error": "Unknown log entry fields: payload"}])
+
+    def test_get_cloud_run_service_logs_filter(self):
+        """Test that the service name and region are quoted in the logging filter"""
+        mock_client = self.mock_logging_client
+        mock_client.list_entries.return_value = []
+
+        with patch('cloud_run.datetime') as mock_datetime:
+            mock_datetime.now.return_value = datetime(2025, 1, 2, 12, 0, tzinfo=timezone.utc)
+            self._run(_get_cloud_run_service_logs('test" OR "x', "test-project", "us-central1", 10, since_hours=6))
+
+        self.assertEqual(
+            mock_client.list_entries.call_args.kwargs["filter_"],
+            'resource.type="cloud_run_revision" '
+            'AND resource.labels.service_name="test\\" OR \\"x" '
+            'AND resource.labels.location="us-central1" '
+            'AND timestamp>="2025-01-02T06:00:00+00:00"',
+        )
+        self.assertEqual(mock_client.list_entries.call_args.kwargs["resource_names"], ["projects/test-project"])
+
+    def test_get_cloud_run_service_logs_off_event_loop(self):
+        """Test that log entries are fetched outside of the event loop thread"""
+        mock_client = self.mock_logging_client
+        threads = []
+        mock_client.list_entries.side_effect = lambda **kwargs: threads.append(threading.current_thread()) or []
+
+        self._run(_get_cloud_run_service_logs("test-service", "test-project", "us-central1", 10))
+
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    def test_get_cloud_run_service_logs_error(self):
         """Test error handling when fetching logs"""
-        mock_client = mock_logging_client.return_value
+        mock_client = self.mock_logging_client
         mock_client.list_entries.side_effect = Exception("Logging error")
-        result = asyncio.run(_get_cloud_run_service_logs("test-service", "test-project", "us-central1", 10))
+        result = self._run(_get_cloud_run_service_logs("test-service", "test-project", "us-central1", 10))
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0]["error"], "Error fetching logs: Logging error")
 
 
-class TestCloudRunMCPTools(unittest.IsolatedAsyncioTestCase):
-    async def asyncSetUp(self):
-        self.mcp = cloud_run_mcp
+# Goes through the full MCP client session, run with pytest -m "" to include
+@pytest.mark.slow
+class TestCloudRunMCPTools(MCPToolTestCase):
+    mcp = cloud_run_mcp
 
-    @patch('cloud_run._list_cloud_run_services', new_callable=AsyncMock)
-    async def test_list_cloud_run_services_tool(self, mock_helper_list_services):
+    @patch('cloud_run._list_cloud_run_services', new_callable=MagicMock)
+    def test_list_cloud_run_services_tool(self, mock_helper_list_services):
         """Test list_cloud_run_services tool"""
-        from fastmcp import Client
+        mock_helper_list_services.side_effect = async_return([ServiceInfo("service1", "uri1")])
         
-        expected_services = [{"name": "service1", "uri": "uri1"}]
-        mock_helper_list_services.return_value = expected_services
+        result = self._run(self.client.call_tool("list_cloud_run_services", {"project_id": "test-project", "region": "us-central1"}))
         
-        async with Client(self.mcp) as client:
-            result = await client.call_tool("list_cloud_run_services", {"project_id": "test-project", "region": "us-central1"})
-            
-            import json
-            result_data = json.loads(result[0].text)
-            self.assertEqual(result_data, expected_services)
-            mock_helper_list_services.assert_called_once_with("test-project", "us-central1")
-
-    @patch('cloud_run._delete_cloud_run_service', new_callable=AsyncMock)
-    async def test_delete_cloud_run_service_tool(self, mock_helper_delete_service):
+        result_data = json.loads(result[0].text)
+        self.assertEqual(result_data, [{"name": "service1", "uri": "uri1"}])
+        mock_helper_list_services.assert_called_once_with("test-project", "us-central1")
+
+    @patch('cloud_run._list_cloud_run_services', new_callable=MagicMock)
+    def test_list_cloud_run_services_tool_error(self, mock_helper_list_services):
+        """Test list_cloud_run_services tool when listing fails"""
+        mock_helper_list_services.side_effect = async_raise(Exception("Permission denied"))
+
+        result = self._run(self.client.call_tool("list_cloud_run_services", {"project_id": "test-project", "region": "us-central1"}))
+
+        result_data = json.loads(result[0].text)
+        self.assertEqual(result_data, [{"error": "Error listing Cloud Run services: Permission denied"}])
+
+    @patch('cloud_run._delete_cloud_run_service', new_callable=MagicMock)
+    def test_delete_cloud_run_service_tool(self, mock_helper_delete_service):
         """Test delete_cloud_run_service tool"""
-        from fastmcp import Client
-        
         expected_response = {"status": "success", "message": "Service 'test-service' successfully deleted"}
-        mock_helper_delete_service.return_value = expected_response
-
-        async with Client(self.mcp) as client:
-            result = await client.call_tool("delete_cloud_run_service", {
-                "service_name": "test-service", 
-                "project_id": "test-project", 
-                "region": "us-central1"
-            })
-
-            import json
-            result_data = json.loads(result[0].text)
-            self.assertEqual(result_data, expected_response)
-            mock_helper_delete_service.assert_called_once_with("test-service", "test-project", "us-central1")
-
-    @patch('cloud_run._get_cloud_run_service_logs', new_callable=AsyncMock)
-    async def test_get_cloud_run_service_logs_tool(self, mock_helper_get_logs):
+        mock_helper_delete_service.side_effect = async_return(expected_response)
+
+        result = self._run(self.client.call_tool("delete_cloud_run_service", {
+            "service_name": "test-service", 
+            "project_id": "test-project", 
+            "region": "us-central1"
+        }))
+
+        result_data = json.loads(result[0].text)
+        self.assertEqual(result_data, expected_response)
+        mock_helper_delete_service.assert_called_once_with("test-service", "test-project", "us-central1")
+
+    @patch('cloud_run._get_cloud_run_service_logs', new_callable=MagicMock)
+    def test_get_cloud_run_service_logs_tool(self, mock_helper_get_logs):
         """Test get_cloud_run_service_logs tool"""
-        from fastmcp import Client
-        
         expected_logs = [{"timestamp": "sometime", "text_payload": "log message"}]
-        mock_helper_get_logs.return_value = expected_logs
-
-        async with Client(self.mcp) as client:
-            result = await client.call_tool("get_cloud_run_service_logs", {
-                "service_name": "test-service", 
-                "project_id": "test-project", 
-                "region": "us-central1", 
-                "limit": 50
-            })
-            
-            import json
-            result_data = json.loads(result[0].text)
-            self.assertEqual(result_data, expected_logs)
-            mock_helper_get_logs.assert_called_once_with("test-service", "test-project", "us-central1", 50)
+        mock_helper_get_logs.side_effect = async_return(expected_logs)
+
+        result = self._run(self.client.call_tool("get_cloud_run_service_logs", {
+            "service_name": "test-service", 
+            "project_id": "test-project", 
+            "region": "us-central1", 
+            "limit": 50
+        }))
+        
+        result_data = json.loads(result[0].text)
+        self.assertEqual(result_data, expected_logs)
+        mock_helper_get_logs.assert_called_once_with("test-service", "test-project", "us-central1", 50, None, 24)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,104 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+# Import the functions to test
+import gcp_clients
+from gcp_clients import get_secret_client, borrow_run_client, get_logging_client
+
+
+class TestGcpClients(unittest.TestCase):
+    """Test cases for the shared GCP clients"""
+
+    def setUp(self):
+        # Drop cached clients so each test sees its own patched client classes
+        gcp_clients._secret_client = None
+        gcp_clients._run_clients.clear()
+        gcp_clients._run_client_calls.clear()
+        gcp_clients._run_credentials.cache_clear()
+        get_logging_client.cache_clear()
+
+    @patch('gcp_clients.secretmanager.SecretManagerServiceAsyncClient', autospec=True)
+    def test_secret_client_is_reused(self, mock_client_class):
+        """Test that the Secret Manager client is only constructed once across calls"""
+        first = get_secret_client()
+        second = get_secret_client()
+
+        mock_client_class.assert_called_once()
+        self.assertIs(first, second)
+
+    @patch('gcp_clients.google.auth.default', return_value=(MagicMock(), "test-project"))
+    @patch('gcp_clients.run_v2.ServicesAsyncClient', autospec=True)
+    def test_run_client_reused_when_idle(self, mock_client_class, mock_default):
+        """Test that sequential Cloud Run calls share a single client"""
+        with borrow_run_client() as first:
+            pass
+        with borrow_run_client() as second:
+            pass
+
+        mock_client_class.assert_called_once()
+        self.assertIs(first, second)
+
+    @patch('gcp_clients.RUN_CHANNEL_POOL_SIZE', 2)
+    @patch('gcp_clients.google.auth.default', return_value=(MagicMock(), "test-project"))
+    @patch('gcp_clients.run_v2.ServicesAsyncClient', autospec=True)
+    def test_run_client_pool(self, mock_client_class, mock_default):
+        """Test that the Cloud Run pool grows while all clients are busy, up to its size"""
+        mock_client_class.side_effect = [MagicMock(), MagicMock()]
+
+        with borrow_run_client() as first, borrow_run_client() as second:
+            with borrow_run_client() as third:
+                pass
+            self.assertEqual(gcp_clients._run_client_calls, [1, 1])
+
+        self.assertEqual(mock_client_class.call_count, 2)
+        self.assertIsNot(first, second)
+        self.assertIn(third, (first, second))
+        self.assertEqual(gcp_clients._run_client_calls, [0, 0])
+        # Credentials are discovered once and shared by every client of the pool
+        mock_default.assert_called_once()
+        for client_call in mock_client_class.call_args_list:
+            self.assertIs(client_call.kwargs["credentials"], mock_default.return_value[0])
+
+    @patch('gcp_clients.logging_v2.Client')
+    def test_logging_client_per_project(self, mock_client_class):
+        """Test that one Cloud Logging client is kept per project"""
+        mock_client_class.side_effect = lambda project: MagicMock(project=project)
+
+        first = get_logging_client("project-1")
+        again = get_logging_client("project-1")
+        other = get_logging_client("project-2")
+
+        self.assertEqual(mock_client_class.call_count, 2)
+        self.assertIs(first, again)
+        self.assertEqual(other.project, "project-2")
+
+    @patch('gcp_clients.logging_v2.Client')
+    def test_logging_client_cache_is_bounded(self, mock_client_class):
+        """Test that the least recently used Cloud Logging client is dropped once the cache is full"""
+        for i in range(gcp_clients.LOGGING_CLIENT_CACHE_SIZE + 1):
+            get_logging_client(f"project-{i}")
+        get_logging_client("project-0")
+
+        self.assertEqual(mock_client_class.call_count, gcp_clients.LOGGING_CLIENT_CACHE_SIZE + 2)
+
+    @patch('gcp_clients.SecretManagerServiceGrpcAsyncIOTransport.create_channel')
+    def test_secret_channel_options(self, mock_create_channel):
+        """Test that the Secret Manager channel keeps the transport options and adds the tuned ones"""
+        gcp_clients._create_secret_channel("secretmanager.googleapis.com", options=[("grpc.max_send_message_length", -1)])
+
+        options = mock_create_channel.call_args.kwargs["options"]
+        self.assertIn(("grpc.max_send_message_length", -1), options)
+        self.assertIn(("grpc.keepalive_time_ms", 30000), options)
+
+    @patch('gcp_clients.ServicesGrpcAsyncIOTransport.create_channel')
+    def test_run_channel_options(self, mock_create_channel):
+        """Test that each Cloud Run channel gets a connection of its own"""
+        gcp_clients._create_run_channel("run.googleapis.com", options=[])
+
+        options = mock_create_channel.call_args.kwargs["options"]
+        self.assertIn(("grpc.use_local_subchannel_pool", 1), options)
+        self.assertIn(("grpc.keepalive_time_ms", 30000), options)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,215 +1,318 @@
+import json
 import unittest
-from unittest.mock import patch, MagicMock, AsyncMock
+from unittest.mock import patch, call, MagicMock, create_autospec
 import asyncio
+import time
+import pytest
+from types import SimpleNamespace
 from google.api_core.exceptions import NotFound
+from google.cloud import secretmanager
+
+from mcp_testing import MCPToolTestCase, SharedLoopTestCase, async_iter, async_raise, async_return
 
 # Import the functions to test
 import secret_manager
+import gcp_clients
 # Only import helper functions, not tool functions that are defined inside init
-from secret_manager import _list_secrets, _delete_secret, _add_secret, _get_secret, secret_manager_mcp
+from secret_manager import _list_secrets, _delete_secret, _add_secret, _get_secret, _get_secrets, secret_manager_mcp
+
+
+# Shared by the tests below, the mocks only ever raise the exception and never change it
+_NOT_FOUND = NotFound("Secret not found")
+_SECRET_PATH = "projects/test-project/secrets/test-secret"
+_VERSION_PATH = _SECRET_PATH + "/versions/1"
+_LATEST_VERSION_PATH = _SECRET_PATH + "/versions/latest"
+
+
+async def _gather(*coros, **kwargs):
+    """Gather coroutines, wrapped in a coroutine of its own so asyncio.gather runs on the test loop"""
+    return await asyncio.gather(*coros, **kwargs)
+
+
+# Client class mock shared by the tests of this module, as building a spec'd mock walks the whole class
+_SECRET_CLIENT_CLASS = create_autospec(secretmanager.SecretManagerServiceAsyncClient)
 
 
 # Renamed for clarity: Tests for the MCP tool endpoints
-class TestSecretManagerMCPTools(unittest.IsolatedAsyncioTestCase):
+# Goes through the full MCP client session, run with pytest -m "" to include
+@pytest.mark.slow
+class TestSecretManagerMCPTools(MCPToolTestCase):
     """Test cases for Secret Manager MCP tool functions"""
 
-    async def asyncSetUp(self):
-        self.mcp = secret_manager_mcp
+    mcp = secret_manager_mcp
 
-    @patch('secret_manager._get_secret', new_callable=AsyncMock)
-    async def test_get_secret_value_tool_successful(self, mock_helper_get_secret):
+    @patch('secret_manager._get_secret', new_callable=MagicMock)
+    def test_get_secret_value_tool_successful(self, mock_helper_get_secret):
         """Test get_secret_value tool when successful"""
-        from fastmcp import Client
+        mock_helper_get_secret.side_effect = async_return("test-secret-value")
         
-        mock_helper_get_secret.return_value = "test-secret-value"
+        result = self._run(self.client.call_tool("get_secret_value", {"secret_name": "test-secret", "project_id": "test-project"}))
         
-        async with Client(self.mcp) as client:
-            result = await client.call_tool("get_secret_value", {"secret_name": "test-secret", "project_id": "test-project"})
-            
-            mock_helper_get_secret.assert_called_once_with("test-secret", "test-project")
-            # Parse the result text as it will be JSON
-            import json
-            result_data = json.loads(result[0].text)
-            self.assertEqual(result_data["status"], "success")
-            self.assertEqual(result_data["value"], "test-secret-value")
-
-    @patch('secret_manager._get_secret', new_callable=AsyncMock)
-    async def test_get_secret_value_tool_error(self, mock_helper_get_secret):
+        mock_helper_get_secret.assert_called_once_with("test-secret", "test-project")
+        # Parse the result text as it will be JSON
+        result_data = json.loads(result[0].text)
+        self.assertEqual(result_data["status"], "success")
+        self.assertEqual(result_data["value"], "test-secret-value")
+
+    @patch('secret_manager._get_secret', new_callable=MagicMock)
+    def test_get_secret_value_tool_error(self, mock_helper_get_secret):
         """Test get_secret_value tool when error occurs"""
-        from fastmcp import Client
+        mock_helper_get_secret.side_effect = async_raise(Exception("Secret access error"))
         
-        mock_helper_get_secret.side_effect = Exception("Secret access error")
+        result = self._run(self.client.call_tool("get_secret_value", {"secret_name": "test-secret", "project_id": "test-project"}))
         
-        async with Client(self.mcp) as client:
-            result = await client.call_tool("get_secret_value", {"secret_name": "test-secret", "project_id": "test-project"})
-            
-            mock_helper_get_secret.assert_called_once_with("test-secret", "test-project")
-            import json
-            result_data = json.loads(result[0].text)
-            self.assertEqual(result_data["status"], "error")
-            self.assertIn("Secret access error", result_data["message"])
-
-    @patch('secret_manager._list_secrets', new_callable=AsyncMock)
-    async def test_list_secrets_tool(self, mock_helper_list_secrets):
+        mock_helper_get_secret.assert_called_once_with("test-secret", "test-project")
+        # The error text is enough to check, no need to parse the JSON result
+        self.assertIn('"status": "error"', result[0].text)
+        self.assertIn("Secret access error", result[0].text)
+
+    @patch('secret_manager._get_secrets', new_callable=MagicMock)
+    def test_get_secret_values_tool(self, mock_helper_get_secrets):
+        """Test get_secret_values tool with one readable and one failing secret"""
+        mock_helper_get_secrets.side_effect = async_return(["value-1", Exception("Secret access error")])
+
+        result = self._run(self.client.call_tool("get_secret_values", {"secret_names": ["secret-1", "secret-2"], "project_id": "test-project"}))
+
+        mock_helper_get_secrets.assert_called_once_with(["secret-1", "secret-2"], "test-project")
+        result_data = json.loads(result[0].text)
+        self.assertEqual(result_data["secret-1"], {"status": "success", "value": "value-1"})
+        self.assertEqual(result_data["secret-2"]["status"], "error")
+        self.assertIn("Secret access error", result_data["secret-2"]["message"])
+
+    @patch('secret_manager._list_secrets', new_callable=MagicMock)
+    def test_list_secrets_tool(self, mock_helper_list_secrets):
         """Test list_secrets tool"""
-        from fastmcp import Client
-        
         expected_secrets = ["secret1", "secret2"]
-        mock_helper_list_secrets.return_value = expected_secrets
+        mock_helper_list_secrets.side_effect = async_return(expected_secrets)
         
-        async with Client(self.mcp) as client:
-            result = await client.call_tool("list_secrets", {"project_id": "test-project", "prefix": "test-"})
-            
-            import json
-            result_data = json.loads(result[0].text)
-            self.assertEqual(result_data, expected_secrets)
-            mock_helper_list_secrets.assert_called_once_with("test-project", "test-")
-
-    @patch('secret_manager._delete_secret', new_callable=AsyncMock)
-    async def test_delete_secret_tool(self, mock_helper_delete_secret):
-        """Test delete_secret tool"""
-        from fastmcp import Client
+        result = self._run(self.client.call_tool("list_secrets", {"project_id": "test-project", "prefix": "test-"}))
         
+        result_data = json.loads(result[0].text)
+        self.assertEqual(result_data, expected_secrets)
+        mock_helper_list_secrets.assert_called_once_with("test-project", "test-")
+
+    @patch('secret_manager._delete_secret', new_callable=MagicMock)
+    def test_delete_secret_tool(self, mock_helper_delete_secret):
+        """Test delete_secret tool"""
         # _delete_secret doesn't return a value, the tool wraps it
-        mock_helper_delete_secret.return_value = None 
-
-        async with Client(self.mcp) as client:
-            result = await client.call_tool("delete_secret", {"secret_name": "test-secret", "project_id": "test-project"})
-            
-            import json
-            result_data = json.loads(result[0].text)
-            self.assertEqual(result_data["status"], "success")
-            self.assertIn("successfully deleted", result_data["message"])
-            mock_helper_delete_secret.assert_called_once_with("test-secret", "test-project")
-
-    @patch('secret_manager._add_secret', new_callable=AsyncMock)
-    async def test_add_secret_tool(self, mock_helper_add_secret):
-        """Test add_secret tool"""
-        from fastmcp import Client
+        mock_helper_delete_secret.side_effect = async_return(None)
+
+        result = self._run(self.client.call_tool("delete_secret", {"secret_name": "test-secret", "project_id": "test-project"}))
         
-        version_name = "projects/test-project/secrets/test-secret/versions/1"
-        mock_helper_add_secret.return_value = version_name
+        self.assertIn('"status": "success"', result[0].text)
+        self.assertIn("successfully deleted", result[0].text)
+        mock_helper_delete_secret.assert_called_once_with("test-secret", "test-project")
+
+    @patch('secret_manager._add_secret', new_callable=MagicMock)
+    def test_add_secret_tool(self, mock_helper_add_secret):
+        """Test add_secret tool"""
+        version_name = _VERSION_PATH
+        mock_helper_add_secret.side_effect = async_return(version_name)
 
-        async with Client(self.mcp) as client:
-            result = await client.call_tool("add_secret", {
-                "secret_name": "test-secret", 
-                "project_id": "test-project", 
-                "secret_value": "supersecret"
-            })
+        result = self._run(self.client.call_tool("add_secret", {
+            "secret_name": "test-secret", 
+            "project_id": "test-project", 
+            "secret_value": "supersecret"
+        }))
 
-            import json
-            result_data = json.loads(result[0].text)
-            self.assertEqual(result_data["status"], "success")
-            self.assertIn(f"New version: {version_name}", result_data["message"])
-            mock_helper_add_secret.assert_called_once_with("test-secret", "test-project", "supersecret")
+        self.assertIn('"status": "success"', result[0].text)
+        self.assertIn(f"New version: {version_name}", result[0].text)
+        mock_helper_add_secret.assert_called_once_with("test-secret", "test-project", "supersecret")
 
 
-class TestSecretManagerFunctions(unittest.TestCase):
+class TestSecretManagerFunctions(SharedLoopTestCase):
     """Test cases for Secret Manager functions"""
 
-    @patch('secret_manager.secretmanager.SecretManagerServiceClient')
-    def test_get_secret(self, mock_client_class):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Patch the client class once for the whole class, it is reset before each test
+        patcher = patch('gcp_clients.secretmanager.SecretManagerServiceAsyncClient', _SECRET_CLIENT_CLASS)
+        patcher.start()
+        cls.addClassCleanup(patcher.stop)
+
+    def setUp(self):
+        _SECRET_CLIENT_CLASS.reset_mock()
+        self.mock_client = _SECRET_CLIENT_CLASS.return_value
+        self.mock_client.reset_mock(return_value=True, side_effect=True)
+        # Drop the cached client so each test constructs it from the patched client class
+        gcp_clients._secret_client = None
+        secret_manager._secret_cache.clear()
+        secret_manager._secret_inflight.clear()
+
+    def test_get_secret(self):
         """Test getting a secret value"""
         # Mock setup
-        mock_client = mock_client_class.return_value
+        mock_client = self.mock_client
         
         # Create mock response
-        mock_response = MagicMock()
-        mock_payload = MagicMock()
-        mock_payload.data = b"test-secret-value"
-        mock_response.payload = mock_payload
-        
-        mock_client.access_secret_version.return_value = mock_response
+        mock_client.access_secret_version.return_value = SimpleNamespace(payload=SimpleNamespace(data=b"test-secret-value"))
         
         # Call the function
-        result = asyncio.run(_get_secret("test-secret", "test-project"))
+        result = self._run(_get_secret("test-secret", "test-project"))
         
         # Assertions
-        mock_client.access_secret_version.assert_called_once_with(
-            name="projects/test-project/secrets/test-secret/versions/latest"
-        )
+        self.assertEqual(mock_client.mock_calls, [call.access_secret_version(name=_LATEST_VERSION_PATH)])
         self.assertEqual(result, "test-secret-value")
 
-    @patch('secret_manager.secretmanager.SecretManagerServiceClient')
-    def test_list_secrets(self, mock_client_class):
+    def test_get_secrets(self):
+        """Test getting several secrets, one of which cannot be read"""
+        mock_client = self.mock_client
+
+        def access_secret_version(name):
+            if name.endswith("/missing-secret/versions/latest"):
+                raise _NOT_FOUND
+            return SimpleNamespace(payload=SimpleNamespace(data=name.encode("UTF-8")))
+        mock_client.access_secret_version.side_effect = access_secret_version
+
+        result = self._run(_get_secrets(["test-secret", "missing-secret"], "test-project"))
+
+        self.assertEqual(mock_client.access_secret_version.call_count, 2)
+        self.assertEqual(result[0], _LATEST_VERSION_PATH)
+        self.assertIsInstance(result[1], NotFound)
+
+    def test_get_secret_cached(self):
+        """Test that repeated reads of a secret are served from the cache"""
+        mock_client = self.mock_client
+        mock_client.access_secret_version.return_value = SimpleNamespace(payload=SimpleNamespace(data=b"test-secret-value"))
+
+        first = self._run(_get_secret("test-secret", "test-project"))
+        second = self._run(_get_secret("test-secret", "test-project"))
+
+        mock_client.access_secret_version.assert_called_once()
+        self.assertEqual(first, "test-secret-value")
+        self.assertEqual(second, "test-secret-value")
+
+    def test_get_secret_concurrent_misses(self):
+        """Test that concurrent reads of an uncached secret share a single request"""
+        mock_client = self.mock_client
+        mock_client.access_secret_version.return_value = SimpleNamespace(payload=SimpleNamespace(data=b"test-secret-value"))
+
+        result = self._run(_gather(*(_get_secret("test-secret", "test-project") for _ in range(5))))
+
+        mock_client.access_secret_version.assert_called_once()
+        self.assertEqual(result, ["test-secret-value"] * 5)
+        self.assertEqual(secret_manager._secret_inflight, {})
+
+    def test_get_secret_concurrent_misses_error(self):
+        """Test that a failed shared read is reported to every caller and not cached"""
+        mock_client = self.mock_client
+        mock_client.access_secret_version.side_effect = _NOT_FOUND
+
+        result = self._run(_gather(*(_get_secret("test-secret", "test-project") for _ in range(2)), return_exceptions=True))
+
+        mock_client.access_secret_version.assert_called_once()
+        self.assertTrue(all(isinstance(error, NotFound) for error in result))
+        self.assertEqual(secret_manager._secret_cache, {})
+
+    @patch('secret_manager.SECRET_TTL_SECONDS', 0)
+    def test_get_secret_cache_expired(self):
+        """Test that a secret is read again once its cache entry has expired"""
+        mock_client = self.mock_client
+        mock_client.access_secret_version.return_value = SimpleNamespace(payload=SimpleNamespace(data=b"test-secret-value"))
+
+        self._run(_get_secret("test-secret", "test-project"))
+        self._run(_get_secret("test-secret", "test-project"))
+
+        self.assertEqual(mock_client.access_secret_version.call_count, 2)
+        self.assertEqual(secret_manager._secret_cache, {})
+
+    def test_get_secret_expired_dropped_on_failed_read(self):
+        """Test that an expired secret value is not kept when reading it again fails"""
+        mock_client = self.mock_client
+        mock_client.access_secret_version.side_effect = _NOT_FOUND
+        secret_manager._secret_cache[("test-project", "test-secret")] = (time.monotonic() - secret_manager.SECRET_TTL_SECONDS, "old-value")
+
+        with self.assertRaises(NotFound):
+            self._run(_get_secret("test-secret", "test-project"))
+
+        self.assertEqual(secret_manager._secret_cache, {})
+
+    @patch('secret_manager.SECRET_CACHE_SIZE', 2)
+    def test_get_secret_cache_bounded(self):
+        """Test that the oldest secret value is dropped once the cache is full"""
+        mock_client = self.mock_client
+        mock_client.access_secret_version.return_value = SimpleNamespace(payload=SimpleNamespace(data=b"test-secret-value"))
+
+        for secret_name in ("secret-1", "secret-2", "secret-3"):
+            self._run(_get_secret(secret_name, "test-project"))
+
+        self.assertEqual(list(secret_manager._secret_cache), [("test-project", "secret-2"), ("test-project", "secret-3")])
+
+    def test_add_secret_invalidates_cache(self):
+        """Test that adding a secret version drops the cached value"""
+        mock_client = self.mock_client
+        mock_client.access_secret_version.return_value = SimpleNamespace(payload=SimpleNamespace(data=b"old-value"))
+        self._run(_get_secret("test-secret", "test-project"))
+
+        self._run(_add_secret("test-secret", "test-project", "new-value"))
+        mock_client.access_secret_version.return_value = SimpleNamespace(payload=SimpleNamespace(data=b"new-value"))
+        result = self._run(_get_secret("test-secret", "test-project"))
+
+        self.assertEqual(mock_client.access_secret_version.call_count, 2)
+        self.assertEqual(result, "new-value")
+
+    def test_list_secrets(self):
         """Test listing secrets"""
         # Mock setup
-        mock_client = mock_client_class.return_value
-        mock_client.project_path.return_value = "projects/test-project"
-        
-        # Mock secret objects
-        mock_secret1 = MagicMock()
-        mock_secret1.name = "projects/test-project/secrets/test-secret-1"
-        mock_secret2 = MagicMock()
-        mock_secret2.name = "projects/test-project/secrets/test-secret-2"
+        mock_client = self.mock_client
+        mock_client.common_project_path.return_value = "projects/test-project"
         
         # Set up the mock to return our test data
-        mock_client.list_secrets.return_value = [mock_secret1, mock_secret2]
+        mock_client.list_secrets.return_value = async_iter([SimpleNamespace(name="projects/test-project/secrets/test-secret-1")])
         
         # Call the function and get result
-        result = asyncio.run(_list_secrets("test-project"))
+        result = self._run(_list_secrets("test-project", "test-"))
         
         # Assertions
-        mock_client.project_path.assert_called_once_with("test-project")
-        mock_client.list_secrets.assert_called_once()
-        self.assertEqual(len(result), 2)
-        self.assertIn("projects/test-project/secrets/test-secret-1", result)
-        self.assertIn("projects/test-project/secrets/test-secret-2", result)
-
-    @patch('secret_manager.secretmanager.SecretManagerServiceClient')
-    def test_delete_secret(self, mock_client_class):
+        self.assertEqual(mock_client.mock_calls, [
+            call.common_project_path("test-project"),
+            call.list_secrets(request={"parent": "projects/test-project", "filter": "name:test-*", "page_size": secret_manager.LIST_PAGE_SIZE}),
+        ])
+        self.assertEqual(result, ["projects/test-project/secrets/test-secret-1"])
+
+    def test_delete_secret(self):
         """Test deleting a secret"""
         # Mock setup
-        mock_client = mock_client_class.return_value
+        mock_client = self.mock_client
         
         # Call the function
-        asyncio.run(_delete_secret("test-secret", "test-project"))
+        self._run(_delete_secret("test-secret", "test-project"))
         
         # Assertions
-        mock_client.delete_secret.assert_called_once_with(name="projects/test-project/secrets/test-secret")
+        self.assertEqual(mock_client.mock_calls, [call.delete_secret(name=_SECRET_PATH)])
 
-    @patch('secret_manager.secretmanager.SecretManagerServiceClient')
-    def test_add_secret_existing(self, mock_client_class):
-        """Test adding a new version to an existing secret"""
-        # Mock setup
-        mock_client = mock_client_class.return_value
-        mock_client.get_secret.return_value = MagicMock()  # Secret exists
-        
-        mock_version = MagicMock()
-        mock_version.name = "projects/test-project/secrets/test-secret/versions/1"
-        mock_client.add_secret_version.return_value = mock_version
-        
-        # Call the function
-        result = asyncio.run(_add_secret("test-secret", "test-project", "secret-value"))
-        
-        # Assertions
-        mock_client.get_secret.assert_called_once_with(name="projects/test-project/secrets/test-secret")
-        mock_client.add_secret_version.assert_called_once()
-        self.assertEqual(result, "projects/test-project/secrets/test-secret/versions/1")
+    def test_add_secret(self):
+        """Test adding a new version to an existing secret and creating a new secret"""
+        mock_client = self.mock_client
+        mock_version = SimpleNamespace(name=_VERSION_PATH)
 
-    @patch('secret_manager.secretmanager.SecretManagerServiceClient')
-    def test_add_secret_new(self, mock_client_class):
-        """Test creating a new secret"""
-        # Mock setup
-        mock_client = mock_client_class.return_value
-        mock_client.get_secret.side_effect = NotFound("Secret not found")
-        
-        mock_secret = MagicMock()
-        mock_secret.name = "projects/test-project/secrets/test-secret"
-        mock_client.create_secret.return_value = mock_secret
-        
-        mock_version = MagicMock()
-        mock_version.name = "projects/test-project/secrets/test-secret/versions/1"
-        mock_client.add_secret_version.return_value = mock_version
-        
-        # Call the function
-        result = asyncio.run(_add_secret("test-secret", "test-project", "secret-value"))
-        
-        # Assertions
-        mock_client.get_secret.assert_called_once_with(name="projects/test-project/secrets/test-secret")
-        mock_client.create_secret.assert_called_once()
-        mock_client.add_secret_version.assert_called_once()
-        self.assertEqual(result, "projects/test-project/secrets/test-secret/versions/1")
+        for existing in (True, False):
+            with self.subTest(existing=existing):
+                # Mock setup
+                mock_client.reset_mock(return_value=True, side_effect=True)
+                if existing:
+                    mock_client.add_secret_version.return_value = mock_version
+                else:
+                    mock_client.create_secret.return_value = SimpleNamespace(name=_SECRET_PATH)
+                    # The first attempt to add a version fails as the secret does not exist yet
+                    mock_client.add_secret_version.side_effect = [_NOT_FOUND, mock_version]
+
+                # Call the function
+                result = self._run(_add_secret("test-secret", "test-project", "secret-value"))
+
+                # Assertions
+                mock_client.add_secret_version.assert_called_with(
+                    parent=_SECRET_PATH, payload={"data": b"secret-value"}
+                )
+                if existing:
+                    mock_client.add_secret_version.assert_called_once()
+                    mock_client.create_secret.assert_not_called()
+                else:
+                    mock_client.create_secret.assert_called_once()
+                    self.assertEqual(mock_client.add_secret_version.call_count, 2)
+                mock_client.get_secret.assert_not_called()
+                self.assertEqual(result, _VERSION_PATH)
 
 
 if __name__ == "__main__":